@@ -50,25 +50,39 @@ class APIWithoutHistory(BaseAPIHandler):
         return completion.choices[0].message.content
 
 class APIWithHistory(BaseAPIHandler):
-    def __init__(self):
+    def __init__(self, session=None, max_history=40):
+        #session:session_store.Session,传入时每轮对话增量写入磁盘,重启后可继续
+        #max_history:发送给模型的最近消息条数(不含系统提示)
         super().__init__()
+        self.session = session
+        self.max_history = max_history
         self.history = []
+        if self.session is not None:
+            #只读取上下文窗口需要的尾部消息
+            self.history = self.session.load_tail(self.max_history)
+            if self.history and self.history[0]["role"] == "assistant":
+                self.history = self.history[1:]  # 窗口从一问一答的中间截断时去掉开头的回答
+
+    def _remember(self, message):
+        self.history.append(message)
+        del self.history[:-self.max_history]  # 内存中只保留上下文窗口内的消息
+        if self.session is not None:
+            self.session.append(message)
 
     def send_request(self, content, api_key, modal_name):
         client = self._create_client(api_key)
-        
-        if not self.history:
-            self.history.append({"role": "system", "content": self.system_message})
-            
-        self.history.append({"role": "user", "content": content})
-        
+
+        question = {"role": "user", "content": content}
+
         completion = client.chat.completions.create(
             model=modal_name,
-            messages=self.history
+            messages=[{"role": "system", "content": self.system_message}] + self.history + [question]
         )
         
         response = completion.choices[0].message.content
-        self.history.append({"role": "assistant", "content": response})
+        #请求成功后才记录,失败重试不会留下没有回答的提问
+        self._remember(question)
+        self._remember({"role": "assistant", "content": response})
 
         self._logStart((
             response,
@@ -7,14 +7,21 @@ import image_in
 class ImageLoadAndSend:
 
     
-    def __init__(self,path = None):
+    def __init__(self,path = None,preprocessor = None):
         self.path = path
+        self.preprocessor = preprocessor#image_preprocess.ImagePreprocessor,为None时原样发送
 
     def load(self):
         image_temp = image_change.ImageLoader()
         temp =  image_temp.load_image(self.path,1024,1024)
-        temp.save(r".\image_temp\temp1001.png")#都变成png格式不就行了?
-        image_return = image_in.Image_input(r".\image_temp\temp1001.png")
+        if self.preprocessor is None:
+            temp_path = r".\image_temp\temp1001.png"
+            temp.save(temp_path)#都变成png格式不就行了?
+        else:
+            #裁掉桌面背景并压缩,像素和字节都更少,token更少上传更快
+            temp_path = rf".\image_temp\temp1001.{self.preprocessor.format}"
+            self.preprocessor.save(self.preprocessor.process(temp), temp_path)
+        image_return = image_in.Image_input(temp_path)
         imageBase64 = image_return.base64_image()
         return imageBase64
     
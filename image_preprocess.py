@@ -0,0 +1,289 @@
+#image_preprocess.py
+import math
+import numpy as np
+from PIL import Image
+
+
+class ImagePreprocessor:
+    """拍照答题的本地预处理:裁剪到文档/文字区域,矫正倾斜,可选灰度或二值化
+
+    全部用NumPy向量化计算,分析在缩小后的副本上进行,原图只做一次裁剪和局部旋转
+    """
+
+    ANALYSIS_SIZE = 512   # 分析用副本的最长边
+    MAX_SKEW = 10.0       # 倾斜检测范围(度)
+    SKEW_STEP = 0.5
+
+    def __init__(self, crop=True, deskew=True, mode=None):
+        #mode:None保持彩色,"gray"灰度,"binary"二值化(纯文字页面)
+        self.crop = crop
+        self.deskew = deskew
+        self.mode = mode
+
+    @property
+    def format(self):
+        """保存格式,二值图用PNG几乎无损且极小,其余用JPEG"""
+        return "png" if self.mode == "binary" else "jpeg"
+
+    def process(self, image):
+        image = image.convert("RGB")
+        #分析都在缩小的副本上做,最后只对要保留的区域做一次裁剪和旋转
+        factor = max(1, math.ceil(max(image.size) / self.ANALYSIS_SIZE))
+        thumb = image.reduce(factor)
+        angle = self.find_skew(self._gray(thumb)) if self.deskew else 0.0
+        #旋转露出的空白和超出原图的部分统一用边框色填充
+        fill = self._border_color(np.asarray(thumb))
+        #先摆正再找区域,纸张框才是横平竖直的,不会把桌面的三角边角带进来
+        rotated = thumb.rotate(angle, expand=True, fillcolor=fill) if angle else thumb
+        #expand后画布比原图大,最多只保留居中的原图大小,像素不会比原来多
+        x0 = (rotated.width - thumb.width) / 2
+        y0 = (rotated.height - thumb.height) / 2
+        box = (x0, y0, x0 + thumb.width, y0 + thumb.height)
+        if self.crop:
+            found = self.find_document(np.asarray(rotated))
+            left, top = found[:2]
+            text = self.find_text(self._gray(rotated.crop(found)))
+            box = (max(left + text[0], box[0]), max(top + text[1], box[1]),
+                   min(left + text[2], box[2]), min(top + text[3], box[3]))
+
+        if self.mode in ("gray", "binary"):
+            image = image.convert("L")  # 单通道旋转快三倍
+            fill = round(fill[0] * 0.299 + fill[1] * 0.587 + fill[2] * 0.114)
+        image = self._extract(image, box, angle, thumb.size, rotated.size, image.width / thumb.width, fill)
+
+        if self.mode == "binary":
+            image = self._binarize_image(image)
+        return image
+
+    def _binarize_image(self, image, k=0.15):
+        """整图二值化,与binarize同一规则;阈值面在缩小的副本上算好再双线性放大,不在原图上做积分图"""
+        factor = max(1, math.ceil(max(image.size) / self.ANALYSIS_SIZE))
+        small = self._gray(image.reduce(factor))
+        local_mean = self._box_mean(small, max(small.shape) // 32 + 1)
+        threshold = Image.fromarray(local_mean * (1 - k)).resize(image.size, Image.Resampling.BILINEAR)
+        return Image.fromarray(np.asarray(image) >= np.asarray(threshold))
+
+    @staticmethod
+    def _extract(image, box, angle, thumb_size, rotated_size, scale, fill):
+        """从原图取出摆正后缩略图上box对应的区域,只旋转这一块而不是整张图;空白处填fill"""
+        left, top, right, bottom = box
+        if not angle:
+            if box == (0, 0) + thumb_size:
+                return image
+            return image.crop((int(left * scale), int(top * scale),
+                               min(math.ceil(right * scale), image.width), min(math.ceil(bottom * scale), image.height)))
+        #box中心映射回原图:PIL的rotate绕中心逆时针转,这里反向转回去
+        radians = math.radians(angle)
+        dx = (left + right) / 2 - rotated_size[0] / 2
+        dy = (top + bottom) / 2 - rotated_size[1] / 2
+        cx = (thumb_size[0] / 2 + dx * math.cos(radians) - dy * math.sin(radians)) * scale
+        cy = (thumb_size[1] / 2 + dx * math.sin(radians) + dy * math.cos(radians)) * scale
+        #先截取能完整包住倾斜区域的外接框,转正后再从中间取出目标大小
+        w = (right - left) * scale
+        h = (bottom - top) * scale
+        half_w = (w * abs(math.cos(radians)) + h * abs(math.sin(radians))) / 2 + 1
+        half_h = (w * abs(math.sin(radians)) + h * abs(math.cos(radians))) / 2 + 1
+        #外接框可能超出原图,PIL的crop会补黑,这里先铺一层fill再贴上原图内的部分
+        bounds = (round(cx - half_w), round(cy - half_h), round(cx + half_w), round(cy + half_h))
+        piece = Image.new(image.mode, (bounds[2] - bounds[0], bounds[3] - bounds[1]), fill)
+        inside = (max(bounds[0], 0), max(bounds[1], 0), min(bounds[2], image.width), min(bounds[3], image.height))
+        piece.paste(image.crop(inside), (inside[0] - bounds[0], inside[1] - bounds[1]))
+        piece = piece.rotate(angle, resample=Image.Resampling.BILINEAR, expand=True, fillcolor=fill)
+        x0 = round((piece.width - w) / 2)
+        y0 = round((piece.height - h) / 2)
+        return piece.crop((x0, y0, x0 + round(w), y0 + round(h)))
+
+    def save(self, image, path):
+        if self.format == "png":
+            image.save(path, optimize=True)
+        else:
+            image.save(path, quality=85, optimize=True)
+
+    @staticmethod
+    def _gray(image):
+        return np.asarray(image.convert("L"), dtype=np.float32)
+
+    @staticmethod
+    def _border_color(rgb):
+        #旋转后露出的空白用图片最外一圈的颜色填充:拍桌面时是桌面色,拍满整页时是纸色
+        ring = np.concatenate([rgb[0], rgb[-1], rgb[:, 0], rgb[:, -1]])
+        return tuple(int(v) for v in np.median(ring, axis=0))
+
+    @staticmethod
+    def otsu(gray):
+        """大津法求全局阈值"""
+        hist = np.bincount(gray.astype(np.uint8).ravel(), minlength=256).astype(np.float64)
+        levels = np.arange(256)
+        weight = np.cumsum(hist)
+        mean = np.cumsum(hist * levels)
+        total = weight[-1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            between = (mean[-1] * weight - mean * total) ** 2 / (weight * (total - weight))
+        if np.isnan(between).all():  # 纯色图只有一个灰度
+            return int(mean[-1] / total)
+        return int(np.nanargmax(between))
+
+    @staticmethod
+    def _span(profile, threshold):
+        #一维投影中超过阈值的首尾位置,找不到时返回None
+        index = np.flatnonzero(profile > threshold)
+        if index.size == 0:
+            return None
+        return int(index[0]), int(index[-1]) + 1
+
+    def find_document(self, rgb):
+        """找纸张区域:亮且不饱和的像素,按行列投影取范围;不像文档时返回整张图"""
+        h, w = rgb.shape[:2]
+        full = (0, 0, w, h)
+        r, g, b = (rgb[..., i].astype(np.int32) for i in range(3))
+        gray = (r * 299 + g * 587 + b * 114) // 1000
+        brightest = np.maximum(np.maximum(r, g), b)
+        spread = brightest - np.minimum(np.minimum(r, g), b)
+        paper = (gray > self.otsu(gray)) & (spread * 4 < brightest)  # 饱和度<0.25
+
+        rows = self._span(paper.mean(axis=1), 0.5 * paper.mean(axis=1).max())
+        cols = self._span(paper.mean(axis=0), 0.5 * paper.mean(axis=0).max())
+        if rows is None or cols is None:
+            return full
+        top, bottom = rows
+        left, right = cols
+        #框内大部分应是纸,且面积不能太小,否则多半是误判(比如插画里的白色衣服)
+        if paper[top:bottom, left:right].mean() < 0.6 or (bottom - top) * (right - left) < 0.15 * h * w:
+            return full
+        return (left, top, right, bottom)
+
+    def find_text(self, gray):
+        """找文字区域:比局部背景暗的像素,按行列投影取范围后留2%边距"""
+        h, w = gray.shape
+        ink = self.binarize(gray) == 0
+        if ink.mean() > 0.3:  # 墨迹过多说明不是文字页面
+            return (0, 0, w, h)
+        #成片的暗区是残留的桌面或阴影,文字笔画周围总有大量背景
+        dark = gray < self.otsu(gray)
+        ink &= self._box_mean(dark.astype(np.float32), max(h, w) // 32 + 1) < 0.5
+        #摆正后纸张框边上还会剩一两个像素宽的桌面边,紧贴边缘的墨迹不算文字
+        band = max(2, max(h, w) // 100)
+        ink[:band] = ink[-band:] = False
+        ink[:, :band] = ink[:, -band:] = False
+        rows = self._span(ink.sum(axis=1), max(1, 0.002 * w))
+        cols = self._span(ink.sum(axis=0), max(1, 0.002 * h))
+        if rows is None or cols is None:
+            return (0, 0, w, h)
+        margin = int(0.02 * max(h, w))
+        return (max(cols[0] - margin, 0), max(rows[0] - margin, 0),
+                min(cols[1] + margin, w), min(rows[1] + margin, h))
+
+    def find_skew(self, gray):
+        """投影法求倾斜角:所有候选角度一次算完,文字行对齐时行投影最尖锐"""
+        ink = self.binarize(gray) == 0
+        if ink.mean() > 0.3:
+            return 0.0
+        y, x = np.nonzero(ink)
+        if y.size < 100:
+            return 0.0
+        step = max(1, y.size // 8000)  # 点数封顶,保证耗时稳定
+        y = y[::step].astype(np.float32)
+        x = x[::step].astype(np.float32)
+
+        angles = np.arange(-self.MAX_SKEW, self.MAX_SKEW + self.SKEW_STEP / 2, self.SKEW_STEP, dtype=np.float32)
+        radians = np.deg2rad(angles)[:, None]
+        #每个候选角度下各点旋转后的行号,(角度数, 点数)
+        rows = np.rint(y * np.cos(radians) - x * np.sin(radians)).astype(np.int64)
+        rows -= rows.min()
+        bins = rows.max() + 1
+        offset = np.arange(len(angles))[:, None] * bins
+        profile = np.bincount((rows + offset).ravel(), minlength=len(angles) * bins).reshape(len(angles), bins)
+        score = (profile.astype(np.float64) ** 2).sum(axis=1)
+        best = int(np.argmax(score))
+        #峰值不明显(非文字内容)或已经摆正时不旋转
+        if score[best] < 1.1 * score[len(angles) // 2] or abs(angles[best]) < self.SKEW_STEP:
+            return 0.0
+        #文字行向右下倾斜时此处为正,PIL的rotate以逆时针为正,正好转回水平
+        return float(angles[best])
+
+    @staticmethod
+    def _box_mean(array, r):
+        #边缘复制填充后用积分图求(2r+1)见方窗口的均值,全部是切片运算
+        size = 2 * r + 1
+        padded = np.pad(array, r + 1, mode="edge")[:-1, :-1]
+        integral = padded.cumsum(axis=0, dtype=np.float32).cumsum(axis=1)
+        local_sum = (integral[size:, size:] - integral[:-size, size:]
+                     - integral[size:, :-size] + integral[:-size, :-size])
+        return local_sum / np.float32(size * size)
+
+    @classmethod
+    def binarize(cls, gray, k=0.15):
+        """局部均值自适应阈值,光照不均时比全局阈值稳;返回uint8,背景255墨迹0"""
+        local_mean = cls._box_mean(gray, max(gray.shape) // 32 + 1)
+        return np.where(gray < local_mean * (1 - k), 0, 255).astype(np.uint8)
+
+    @staticmethod
+    def estimate_tokens(width, height, max_pixels=1280 * 28 * 28):
+        """按通义千问VL的规则估算图片token:每28x28像素一个token,另加2个起止符"""
+        h_bar = max(28, round(height / 28) * 28)
+        w_bar = max(28, round(width / 28) * 28)
+        if h_bar * w_bar > max_pixels:
+            beta = math.sqrt(height * width / max_pixels)
+            h_bar = math.floor(height / beta / 28) * 28
+            w_bar = math.floor(width / beta / 28) * 28
+        return h_bar * w_bar // (28 * 28) + 2
+
+
+if __name__ == "__main__":
+    #对photos文件夹做前后对比:base64负载大小,估算token数,预处理耗时
+    import base64
+    import io
+    import os
+    import time
+    import image_change
+
+    def payload(image, fmt, **kwargs):
+        buffer = io.BytesIO()
+        image.save(buffer, fmt, **kwargs)
+        return len(base64.b64encode(buffer.getvalue()))
+
+    for name in sorted(os.listdir("photos")):
+        path = os.path.join("photos", name)
+        image = image_change.ImageLoader.load_image(path, 1024, 1024)
+        print(f"{name}: 原始 {image.size} PNG {payload(image, 'png') / 1024:.0f}KB "
+              f"token {ImagePreprocessor.estimate_tokens(*image.size)}")
+        for mode in (None, "gray", "binary"):
+            pre = ImagePreprocessor(mode=mode)
+            start = time.perf_counter()
+            out = pre.process(image)
+            cost = (time.perf_counter() - start) * 1000
+            kwargs = {"optimize": True} if pre.format == "png" else {"quality": 85, "optimize": True}
+            print(f"  {mode or 'color'}: {out.size} {pre.format.upper()} {payload(out, pre.format, **kwargs) / 1024:.0f}KB "
+                  f"token {ImagePreprocessor.estimate_tokens(*out.size)} 耗时 {cost:.1f}ms")
+
+    #自检:桌面上倾斜±4度的白纸,摆正后要裁到文字区域,左右边不能残留桌面色
+    from PIL import ImageDraw
+    desk_color = (120, 80, 40)
+    for angle in (0, 4, -4):
+        page = Image.new("RGB", (600, 800), "white")
+        draw = ImageDraw.Draw(page)
+        for i in range(14):
+            for j in range(3):
+                draw.rectangle((80 + j * 150, 120 + i * 40, 200 + j * 150, 132 + i * 40), fill="black")
+        page = page.rotate(angle, expand=True, fillcolor=desk_color, resample=Image.Resampling.BICUBIC)
+        photo = Image.new("RGB", (1000, 1024), desk_color)
+        photo.paste(page, (200, 100))
+        out = np.asarray(ImagePreprocessor().process(photo).convert("L"))
+        edges = np.concatenate([out[:, :3], out[:, -3:]], axis=1)
+        assert out.shape[1] < 500 and out.shape[0] < 600, f"倾斜{angle}度未裁到文字区域: {out.shape}"
+        assert (edges < 150).mean() < 0.05, f"倾斜{angle}度裁剪后边缘残留桌面"
+
+    #自检:贴近拍摄时纸张铺满画面、文字到边,摆正后角上不能出现纯黑三角,也不能比原图大
+    ink_color = (40, 40, 40)  # 文字不用纯黑,纯黑像素只可能来自填充
+    sheet = Image.new("RGB", (1200, 1400), "white")
+    draw = ImageDraw.Draw(sheet)
+    for i in range(46):
+        for j in range(12):
+            draw.rectangle((5 + j * 100, 10 + i * 30, 75 + j * 100, 15 + i * 30), fill=ink_color)
+    for angle in (3, -5, 8):
+        photo = sheet.rotate(angle, resample=Image.Resampling.BICUBIC).crop((200, 200, 1000, 1200))
+        for pre in (ImagePreprocessor(), ImagePreprocessor(mode="gray"), ImagePreprocessor(crop=False)):
+            out = pre.process(photo)
+            assert out.width <= photo.width and out.height <= photo.height, f"倾斜{angle}度输出比原图大: {out.size}"
+            assert (np.asarray(out.convert("L")) == 0).mean() < 0.001, f"倾斜{angle}度输出有纯黑填充"
+    print("倾斜纸张裁剪自检通过")
@@ -0,0 +1,94 @@
+#session_store.py
+import datetime
+import json
+import os
+import struct
+
+# 每条消息在数据文件中的起始偏移,以8字节无符号整数追加写入索引文件
+_OFFSET = struct.Struct("<Q")
+
+
+class Session:
+    """单个会话:数据文件(.jsonl)只追加,索引文件(.idx)记录每条消息的偏移"""
+
+    def __init__(self, data_path, index_path):
+        self.data_path = data_path
+        self.index_path = index_path
+
+    def __len__(self):
+        #消息条数直接由索引文件大小得出,不需要读取内容
+        if not os.path.exists(self.index_path):
+            return 0
+        return os.path.getsize(self.index_path) // _OFFSET.size
+
+    def append(self, message):
+        """追加一条消息,先写数据再写索引,中途崩溃时索引不会指向半条记录"""
+        line = (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+        with open(self.data_path, 'ab') as data:
+            offset = data.tell()
+            data.write(line)
+        with open(self.index_path, 'ab') as index:
+            index.write(_OFFSET.pack(offset))
+
+    def load_tail(self, count):
+        """只读取最后count条消息"""
+        total = len(self)
+        count = min(count, total)
+        if count <= 0:
+            return []
+
+        with open(self.index_path, 'rb') as index:
+            index.seek((total - count) * _OFFSET.size)
+            raw = index.read(count * _OFFSET.size)
+        offsets = [offset for (offset,) in _OFFSET.iter_unpack(raw)]
+
+        with open(self.data_path, 'rb') as data:
+            data.seek(offsets[0])
+            #读到最后一条消息所在行的末尾即可,之后可能是未写完索引的残留数据
+            chunk = data.read(offsets[-1] - offsets[0]) + data.readline()
+
+        #按偏移逐条切分,跳过崩溃时只写了数据没写索引的残留行
+        messages = []
+        for offset in offsets:
+            start = offset - offsets[0]
+            end = chunk.index(b"\n", start)
+            messages.append(json.loads(chunk[start:end].decode("utf-8")))
+        return messages
+
+
+class SessionStore:
+    """会话存储,每个会话对应sessions文件夹内的一对文件"""
+
+    def __init__(self, session_dir="./sessions"):
+        self.session_dir = session_dir
+        if not os.path.exists(session_dir):  # 如果会话文件夹不存在，则创建
+            os.makedirs(session_dir)
+
+    def _paths(self, session_id):
+        base = os.path.join(self.session_dir, session_id)
+        return base + ".jsonl", base + ".idx"
+
+    def new_session(self):
+        """以当前时间命名新建会话,返回会话id"""
+        session_id = datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        data_path, index_path = self._paths(session_id)
+        open(data_path, 'ab').close()
+        open(index_path, 'ab').close()
+        return session_id
+
+    def open(self, session_id):
+        return Session(*self._paths(session_id))
+
+    def list_sessions(self):
+        """列出所有会话id,按最近修改时间倒序,不读取会话内容"""
+        entries = []
+        for name in os.listdir(self.session_dir):
+            if name.endswith(".jsonl"):
+                path = os.path.join(self.session_dir, name)
+                entries.append((os.path.getmtime(path), name[:-len(".jsonl")]))
+        entries.sort(reverse=True)
+        return [session_id for _, session_id in entries]
+
+
+if __name__ == "__main__":
+    pass
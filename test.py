@@ -76,6 +76,11 @@ from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QH
 from PyQt5.QtCore import Qt, pyqtSignal, QObject
 from api_handlers import APIWithoutHistory, APIWithHistory, APIImageWithoutHistory
 from image import ImageLoadAndSend
+try:
+    from image_preprocess import ImagePreprocessor
+except ImportError:  # 图片预处理需要numpy，没装时不显示预处理选项
+    ImagePreprocessor = None
+from session_store import SessionStore
 
 class Communicate(QObject):
     """自定义信号类用于线程间通信"""
@@ -83,6 +88,8 @@ class Communicate(QObject):
     error_signal = pyqtSignal(str)
 
 class MainWindow(QMainWindow):
+    WELCOME = "欢迎使用AI助手！请输入您的问题...(此处可编辑但不可发送)"
+
     def __init__(self):
         super().__init__()
         # 初始化界面
@@ -91,12 +98,16 @@ class MainWindow(QMainWindow):
         
         # 初始化变量
         self.api_key = ""
-        self.history_mode = 0  # 0-无历史 1-有历史 2-图片模式
+        self.history_mode = 0  # 与模式下拉框序号一致：0-有历史 1-无历史 2-图片模式
         self.model_name = "qwen-max"
         self.image_path = r'.\photos\1012.png'
+        self.preprocessor = None  # 图片预处理器，None表示原图发送
         
-        # 初始化API处理器
-        self.api_handler = APIWithoutHistory()
+        # 初始化会话存储（开启上下文时对话增量写入磁盘）
+        self.session_store = SessionStore()
+        sessions = self.session_store.list_sessions()
+        self.session_id = sessions[0] if sessions else self.session_store.new_session()
+        self.shown_session = None  # 对话区当前显示的会话
         
         # 创建信号通信对象
         self.comm = Communicate()
@@ -106,6 +117,9 @@ class MainWindow(QMainWindow):
         # 创建界面组件
         self.init_ui()
 
+        # 初始化API处理器，与模式下拉框默认的"开启上下文"一致
+        self.on_mode_changed(self.history_mode)
+
     def init_ui(self):
         """初始化界面组件"""
         # 主容器
@@ -161,16 +175,43 @@ class MainWindow(QMainWindow):
         mode_layout.addWidget(self.mode_combo)
         main_layout.addLayout(mode_layout)
 
+        # 会话选择（仅在开启上下文时生效）
+        session_layout = QHBoxLayout()
+        session_layout.addWidget(QLabel("会话:"))
+        self.session_combo = QComboBox()
+        self.session_combo.addItems(self.session_store.list_sessions())
+        self.session_combo.setCurrentText(self.session_id)
+        self.session_combo.activated[str].connect(self.on_session_changed)  # 仅响应用户选择
+        session_layout.addWidget(self.session_combo)
+        self.new_session_btn = QPushButton("新会话")
+        self.new_session_btn.clicked.connect(self.new_session)
+        session_layout.addWidget(self.new_session_btn)
+        main_layout.addLayout(session_layout)
+
         # 图片选择按钮（仅在图片模式显示）
         self.image_btn = QPushButton("选择图片")
         self.image_btn.clicked.connect(self.select_image)
         self.image_btn.hide()  # 默认隐藏
         main_layout.addWidget(self.image_btn)
 
+        # 图片预处理选择（仅在图片模式显示）
+        self.preprocess_options = {"不预处理": None}
+        if ImagePreprocessor is not None:
+            self.preprocess_options.update({
+                "裁剪+矫正": ImagePreprocessor(),
+                "裁剪+矫正+灰度": ImagePreprocessor(mode="gray"),
+                "裁剪+矫正+二值化（纯文字）": ImagePreprocessor(mode="binary"),
+            })
+        self.preprocess_combo = QComboBox()
+        self.preprocess_combo.addItems(list(self.preprocess_options))
+        self.preprocess_combo.currentTextChanged.connect(self.on_preprocess_changed)
+        self.preprocess_combo.hide()  # 默认隐藏
+        main_layout.addWidget(self.preprocess_combo)
+
         # 对话显示区域
         self.chat_area = QTextEdit()
         self.chat_area.setReadOnly(False)
-        self.chat_area.append("欢迎使用AI助手！请输入您的问题...(此处可编辑但不可发送)")
+        self.chat_area.append(self.WELCOME)
         main_layout.addWidget(self.chat_area)
 
         # 输入区域
@@ -193,14 +234,43 @@ class MainWindow(QMainWindow):
         self.history_mode = index
         # 更新API处理器
         if index == 0:
-            self.api_handler = APIWithHistory()
+            self.api_handler = APIWithHistory(self.session_store.open(self.session_id))
+            if self.session_id != self.shown_session:
+                self.show_session()
             self.image_btn.hide()
+            self.preprocess_combo.hide()
         elif index == 1:
             self.api_handler = APIWithoutHistory()
             self.image_btn.hide()
+            self.preprocess_combo.hide()
         elif index == 2:
             self.api_handler = APIImageWithoutHistory()
             self.image_btn.show()
+            self.preprocess_combo.setVisible(ImagePreprocessor is not None)
+
+    def show_session(self):
+        """清空对话区并显示从磁盘恢复的上下文"""
+        self.chat_area.clear()
+        self.chat_area.append(self.WELCOME)
+        for message in self.api_handler.history:
+            self.update_display("用户" if message["role"] == "user" else "AI", message["content"])
+        self.shown_session = self.session_id
+
+    def on_preprocess_changed(self, text):
+        """图片预处理方式变更处理"""
+        self.preprocessor = self.preprocess_options[text]
+
+    def on_session_changed(self, session_id):
+        """会话切换处理"""
+        self.session_id = session_id
+        self.on_mode_changed(self.history_mode)
+
+    def new_session(self):
+        """新建会话并切换过去"""
+        self.session_id = self.session_store.new_session()
+        self.session_combo.insertItem(0, self.session_id)
+        self.session_combo.setCurrentIndex(0)
+        self.on_mode_changed(self.history_mode)
 
     def select_image(self):
         """选择图片文件"""
@@ -232,7 +302,7 @@ class MainWindow(QMainWindow):
         """处理API请求（在子线程中执行）"""
         try:
             if self.history_mode == 2:  # 图片模式
-                image_loader = ImageLoadAndSend(self.image_path)
+                image_loader = ImageLoadAndSend(self.image_path, self.preprocessor)
                 response = self.api_handler.send_request(
                     question,
                     api_key,
@@ -5,6 +5,11 @@ from tkinter import ttk , messagebox
 import threading
 from api_handlers import APIWithoutHistory, APIWithHistory, APIImageWithoutHistory
 from image import ImageLoadAndSend
+try:
+    from image_preprocess import ImagePreprocessor
+except ImportError:#图片预处理需要numpy,没装时不显示预处理选项
+    ImagePreprocessor = None
+from session_store import SessionStore
 
 
 
@@ -16,11 +21,16 @@ class Application:
         self.root.config(bg= "white")
 
         self.api_key_var = tk.StringVar()
-        self.history_mode = tk.IntVar(value=0)
+        self.history_mode = tk.IntVar(value=1)#与下拉框默认的"开启上下文"一致
         self.modal_name = tk.StringVar(value="qwen-max")
         self.input_text = ""
         self.api_hander = None
         self.image1 = tk.StringVar(value=r'.\photos\1012.png')
+        self.preprocessor = None
+        self.session_store = SessionStore()
+        sessions = self.session_store.list_sessions()
+        self.session_id = tk.StringVar(value=sessions[0] if sessions else self.session_store.new_session())
+        self.shown_session = None#对话区当前显示的会话
 
         self.create_widgets()
         self.setup_api_hander()
@@ -98,10 +108,59 @@ class Application:
             self.setup_api_hander()
         combo_text.bind("<<ComboboxSelected>>", text_select)
 
+        # 图片预处理,仅在传图片时生效,需要numpy
+        if ImagePreprocessor is not None:
+            preprocess_frame = tk.Frame(self.root)
+            tk.Label(preprocess_frame, text="图片预处理:").pack(side=tk.LEFT)
+            preprocess_options = {
+                "不预处理": None,
+                "裁剪+矫正": ImagePreprocessor(),
+                "裁剪+矫正+灰度": ImagePreprocessor(mode="gray"),
+                "裁剪+矫正+二值化(纯文字)": ImagePreprocessor(mode="binary"),
+            }
+            preprocess_choose = ttk.Combobox(
+                preprocess_frame,
+                values=list(preprocess_options),
+                state="readonly"
+            )
+            preprocess_choose.current(0)
+            preprocess_choose.pack(side=tk.LEFT, padx=5)
+
+            def preprocess_select(event):
+                """绑定选择预处理方式事件"""
+                self.preprocessor = preprocess_options[preprocess_choose.get()]
+            preprocess_choose.bind("<<ComboboxSelected>>", preprocess_select)
+            preprocess_frame.pack()
+
+        # 会话选择,仅在开启上下文时生效
+        session_frame = tk.Frame(self.root)
+        tk.Label(session_frame, text="会话:").pack(side=tk.LEFT)
+        self.session_choose = ttk.Combobox(
+            session_frame,
+            textvariable=self.session_id,
+            postcommand=lambda: self.session_choose.config(values=self.session_store.list_sessions()),#展开时刷新列表
+            state="readonly"
+        )
+        self.session_choose.pack(side=tk.LEFT, padx=5)
+
+        def session_select(event):
+            """绑定切换会话事件"""
+            self.setup_api_hander()
+        self.session_choose.bind("<<ComboboxSelected>>", session_select)
+
+        def session_new():
+            """新建会话并切换过去"""
+            self.session_id.set(self.session_store.new_session())
+            self.setup_api_hander()
+        tk.Button(session_frame, text="新会话", command=session_new).pack(side=tk.LEFT)
+        session_frame.pack()
+
         # 对话显示区域
         self.text_area = tk.Text(self.root, width=80, height=300)
         self.text_area.pack(pady=10)
         self.text_area.insert("1.0", "用户,您好,这是调用qwen的AI助手,请在上方输入框中提问\n\n")
+        self.text_area.mark_set("session_start", "end-1c")#欢迎语之后是会话内容,切换会话时从这里清空
+        self.text_area.mark_gravity("session_start", tk.LEFT)
 
         scrollbar = tk.Scrollbar(self.root)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
@@ -111,12 +170,21 @@ class Application:
     def setup_api_hander(self):
         """根据选择模式初始化API处理器"""
         if self.history_mode.get() == 1:
-            self.api_handler = APIWithHistory()
+            self.api_handler = APIWithHistory(self.session_store.open(self.session_id.get()))
+            if self.session_id.get() != self.shown_session:
+                self.show_session()
         elif self.history_mode.get() == 0:
             self.api_handler = APIWithoutHistory()
         elif self.history_mode.get() == 2:
             self.api_handler = APIImageWithoutHistory()
 
+    def show_session(self):
+        """清空对话区并显示恢复的上下文"""
+        self.text_area.delete("session_start", tk.END)
+        for message in self.api_handler.history:
+            self.update_display("用户" if message["role"] == "user" else "AI", message["content"])
+        self.shown_session = self.session_id.get()
+
     def send_message(self):
         """处理消息发送"""
         self.input_text = self.entry.get()
@@ -131,7 +199,7 @@ class Application:
         """处理API请求"""
         try:
             if self.history_mode.get() == 2:
-                x = ImageLoadAndSend(self.image1.get())
+                x = ImageLoadAndSend(self.image1.get(), self.preprocessor)
                 response = self.api_handler.send_request(
                     self.input_text,
                     self.api_key_var.get(),